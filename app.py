@@ -7,10 +7,8 @@
 
 import streamlit as st
 import os
+import copy
 import datetime
-import audio_processing
-import geometry_generator
-import validation
 from config import AppConfig
 
 # --- Page Configuration ---
@@ -24,7 +22,41 @@ st.title("Groove Rider 🎶")
 st.write("Convert your audio files into 3D-printable vinyl-style records.")
 
 # --- Load Configuration ---
-cfg = AppConfig('config.toml')
+@st.cache_resource
+def _load_app_config() -> AppConfig:
+    """Parses config.toml once per server process."""
+    return AppConfig('config.toml')
+
+# The sidebar writes into the config, so each rerun works on its own copy
+cfg = copy.deepcopy(_load_app_config())
+
+@st.cache_data(show_spinner=False)
+def _process_audio_cached(file_bytes: bytes, file_format: str, target_samplerate: int):
+    """
+    Decodes and normalizes the uploaded audio. Keyed on the file bytes and the
+    config values actually consumed, so unrelated sidebar edits hit the cache.
+    """
+    import audio_processing
+    return audio_processing.decode_audio(file_bytes, file_format, target_samplerate)
+
+@st.fragment
+def results_panel(validation_results):
+    """
+    Renders the download button and validation report. Runs as a fragment so
+    that clicking download only reruns this panel, not the whole script. The
+    STL is served from the in-memory bytes kept in st.session_state.
+    """
+    st.subheader("Results & Download")
+    stl_bytes = st.session_state.get("stl_bytes")
+    if stl_bytes is not None:
+        st.download_button(
+            label="Download STL File",
+            data=stl_bytes,
+            file_name=st.session_state.stl_name,
+            mime="model/stl",
+        )
+        if validation_results is not None:
+            st.json(validation_results)
 
 # --- Sidebar for Configuration ---
 st.sidebar.header("Record Configuration")
@@ -46,13 +78,24 @@ cfg.audio['amplitude_scale'] = st.sidebar.slider("Amplitude Scale", 0.1, 5.0, cf
 
 # --- Main Application Logic ---
 if uploaded_file is not None and st.sidebar.button("Generate Record"):
+    # Heavy modules (numpy-stl, SciPy, matplotlib, Plotly) are only needed once
+    # generation is requested, so keep them off the sidebar-only rerun path.
+    import geometry_generator
+    import validation
+
     col1, col2 = st.columns(2)
+    file_path = None
+    validation_results = None
 
     with col1:
         st.subheader("Processing Steps")
         with st.spinner("Processing audio..."):
             try:
-                samples = audio_processing.load_and_process_audio(uploaded_file, cfg)
+                samples = _process_audio_cached(
+                    uploaded_file.getvalue(),
+                    uploaded_file.name.split('.')[-1],
+                    cfg.audio.get('target_samplerate', 8000),
+                )
                 st.success("Audio processed successfully!")
             except Exception as e:
                 st.error(f"Error processing audio: {e}")
@@ -62,11 +105,17 @@ if uploaded_file is not None and st.sidebar.button("Generate Record"):
             try:
                 record_mesh = geometry_generator.create_record_geometry(samples, cfg)
                 timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+                file_name = f"record_{timestamp}.stl"
+                st.session_state.stl_bytes = geometry_generator.mesh_to_stl_bytes(record_mesh, file_name)
+                st.session_state.stl_name = file_name
+
+                # Validation reads the STL from a path, so only it touches disk
                 temp_dir = "temp"
                 if not os.path.exists(temp_dir):
                     os.makedirs(temp_dir)
-                file_path = os.path.join(temp_dir, f"record_{timestamp}.stl")
-                geometry_generator.save_mesh_as_stl(record_mesh, file_path)
+                file_path = os.path.join(temp_dir, file_name)
+                with open(file_path, "wb") as f:
+                    f.write(st.session_state.stl_bytes)
                 st.success(f"3D model generated!")
             except Exception as e:
                 st.error(f"Error generating 3D model: {e}")
@@ -86,17 +135,7 @@ if uploaded_file is not None and st.sidebar.button("Generate Record"):
                 st.error(f"An error occurred during validation: {e}")
 
     with col2:
-        st.subheader("Results & Download")
-        if 'file_path' in locals() and os.path.exists(file_path):
-             with open(file_path, "rb") as f:
-                st.download_button(
-                    label="Download STL File",
-                    data=f,
-                    file_name=os.path.basename(file_path),
-                    mime="model/stl",
-                )
-             if 'validation_results' in locals():
-                 st.json(validation_results)
+        results_panel(validation_results)
 else:
     st.info("Upload an audio file and click 'Generate Record' to begin.")
 
@@ -7,36 +7,129 @@
 
 import numpy as np
 from pydub import AudioSegment
+from scipy.signal import firwin, resample_poly
+from functools import lru_cache
+from math import gcd
 import io
+import os
 from config import AppConfig
 
-def load_and_process_audio(file_path: str, cfg: AppConfig) -> np.ndarray:
+try:
+    import av
+except ImportError:
+    # Fall back to pydub (and its ffmpeg subprocess) when PyAV isn't installed
+    av = None
+
+@lru_cache(maxsize=8)
+def _design_resample_filter(up: int, down: int) -> np.ndarray:
+    """
+    Designs the anti-aliasing FIR used by resample_poly for an up/down ratio.
+    This mirrors SciPy's default design, but is memoized so repeated decodes
+    at the same source/target rates don't re-derive identical coefficients.
+    """
+    max_rate = max(up, down)
+    taps = firwin(2 * 10 * max_rate + 1, 1.0 / max_rate, window=('kaiser', 5.0))
+    # float32 taps keep upfirdn in single precision for float32 samples
+    taps = taps.astype(np.float32)
+    taps.setflags(write=False)
+    return taps
+
+def _decode_with_av(file_bytes: bytes, file_format: str):
+    """
+    Decodes audio in-process with PyAV, mixing down to mono float32 at the
+    source sample rate. Returns the samples and their sample rate.
+    """
+    with av.open(io.BytesIO(file_bytes), format=file_format) as container:
+        stream = container.streams.audio[0]
+        frame_rate = stream.rate
+        resampler = av.AudioResampler(format='flt', layout='mono', rate=frame_rate)
+        chunks = []
+        for frame in container.decode(stream):
+            chunks.extend(f.to_ndarray() for f in resampler.resample(frame))
+        # Flush any samples still buffered in the resampler
+        chunks.extend(f.to_ndarray() for f in resampler.resample(None))
+
+    if not chunks:
+        return np.zeros(0, dtype=np.float32), frame_rate
+    return np.concatenate(chunks, axis=1).ravel(), frame_rate
+
+def _decode_with_pydub(file_bytes: bytes, file_format: str):
+    """
+    Decodes audio with pydub, mixing down to mono float32 at the source
+    sample rate. Returns the samples and their sample rate.
+    """
+    audio = AudioSegment.from_file(io.BytesIO(file_bytes), format=file_format)
+
+    # Wrap the raw (interleaved) PCM bytes without copying, then mix down to mono
+    dtype = {1: np.int8, 2: np.int16, 4: np.int32}[audio.sample_width]
+    samples = np.frombuffer(audio.raw_data, dtype=dtype).astype(np.float32)
+    if audio.channels > 1:
+        samples = samples.reshape(-1, audio.channels).mean(axis=1)
+    return samples, audio.frame_rate
+
+def decode_audio(file_bytes: bytes, file_format: str, target_samplerate: int) -> np.ndarray:
+    """
+    Decodes raw audio file bytes, converts them to mono, and normalizes the
+    waveform. This is a pure function of its arguments so that callers can
+    memoize it (e.g. with st.cache_data) across reruns.
+
+    Args:
+        file_bytes: The encoded contents of the audio file.
+        file_format: The container format, e.g. 'mp3' or 'wav', or None to
+            let the decoder probe it from the data.
+        target_samplerate: The sample rate to downsample the audio to.
+
+    Returns:
+        A float32 NumPy array of the audio samples.
+    """
+    # Decode from an in-memory buffer to mono float32 samples
+    if av is not None:
+        samples, frame_rate = _decode_with_av(file_bytes, file_format)
+    else:
+        samples, frame_rate = _decode_with_pydub(file_bytes, file_format)
+
+    # Downsample the audio to reduce the number of vertices in the final mesh.
+    # A polyphase FIR resampler in NumPy/SciPy replaces pydub's set_frame_rate.
+    g = gcd(frame_rate, target_samplerate)
+    up, down = target_samplerate // g, frame_rate // g
+    if up != down:
+        samples = resample_poly(samples, up, down, window=_design_resample_filter(up, down))
+
+    # Normalize samples to be between -1 and 1, in place. The peak comes from
+    # two reductions rather than materializing a full |samples| temporary.
+    peak = max(-samples.min(), samples.max()) if samples.size else 0.0
+    if peak > 0:
+        np.multiply(samples, 1.0 / peak, out=samples)
+
+    return samples
+
+def load_and_process_audio(file_obj, cfg: AppConfig, file_format: str = None) -> np.ndarray:
     """
     Loads an audio file, converts it to mono, and normalizes the waveform.
     Includes a downsampling step to reduce the final STL file size.
     
     Args:
-        file_path: The path to the audio file.
+        file_obj: The audio file, either as raw bytes or a file-like object
+            (e.g. a Streamlit UploadedFile or io.BytesIO). Nothing is written
+            to disk.
         cfg: The application configuration object.
+        file_format: The container format. Inferred from the file name when
+            omitted; without a file extension the decoder probes the data.
 
     Returns:
-        A NumPy array of the audio samples.
+        A float32 NumPy array of the audio samples.
     """
-    # Load audio file from file-like object
-    audio = AudioSegment.from_file(io.BytesIO(file_path.read()), format=file_path.name.split('.')[-1])
+    if isinstance(file_obj, (bytes, bytearray, memoryview)):
+        file_bytes = bytes(file_obj)
+    elif hasattr(file_obj, 'getvalue'):
+        # getvalue() doesn't consume the stream, so repeated calls still work
+        file_bytes = file_obj.getvalue()
+    else:
+        file_bytes = file_obj.read()
 
-    # Convert to mono
-    audio = audio.set_channels(1)
+    if file_format is None:
+        extension = os.path.splitext(getattr(file_obj, 'name', None) or '')[1]
+        file_format = extension[1:].lower() or None
 
-    # Downsample the audio to reduce the number of vertices in the final mesh
     target_samplerate = cfg.audio.get('target_samplerate', 8000)
-    audio = audio.set_frame_rate(target_samplerate)
-
-    # Get raw audio data as a NumPy array
-    samples = np.array(audio.get_array_of_samples())
-
-    # Normalize samples to be between -1 and 1
-    samples = samples / np.max(np.abs(samples))
-
-    return samples
-
+    return decode_audio(file_bytes, file_format, target_samplerate)
@@ -4,10 +4,34 @@
 # This script handles loading and accessing application configuration
 # from the config.toml file.
 
+import copy
+import os
 import toml
 from dataclasses import dataclass, field
+from functools import lru_cache
 from typing import Dict, Any
 
+@lru_cache(maxsize=8)
+def _load(path: str, mtime: float) -> Dict[str, Any]:
+    """
+    Parses a TOML file. The modification time is part of the cache key so an
+    edited file is re-read on the next call.
+    """
+    with open(path, "r") as f:
+        return toml.load(f)
+
+def load_config(path: str = "config.toml") -> Dict[str, Any]:
+    """
+    Loads the configuration as a plain dictionary. Parsed files are cached,
+    and each caller receives its own copy that it is free to modify.
+    """
+    try:
+        mtime = os.path.getmtime(path)
+    except FileNotFoundError:
+        print(f"Warning: Configuration file '{path}' not found. Using default values.")
+        return {}
+    return copy.deepcopy(_load(path, mtime))
+
 @dataclass
 class AppConfig:
     """
@@ -31,14 +55,11 @@ class AppConfig:
         dataclass fields.
         """
         try:
-            with open(path, "r") as f:
-                config_data = toml.load(f)
-                self.record = config_data.get('record', self.record)
-                self.audio = config_data.get('audio', self.audio)
-                self.server = config_data.get('server', self.server)
-        except FileNotFoundError:
-            # It's good practice to handle the case where the config file is missing
-            print(f"Warning: Configuration file '{path}' not found. Using default values.")
+            # load_config warns and returns an empty dict if the file is missing
+            config_data = load_config(path)
+            self.record = config_data.get('record', self.record)
+            self.audio = config_data.get('audio', self.audio)
+            self.server = config_data.get('server', self.server)
         except Exception as e:
             # Catch other potential errors during file loading
             print(f"Error loading configuration from '{path}': {e}")
@@ -4,14 +4,15 @@
 # This script is responsible for generating the 3D geometry of the vinyl record
 # from the processed audio data. It uses numpy-stl to create the mesh.
 
+import io
 import numpy as np
-from stl import mesh
+from stl import mesh, Mode
 from config import AppConfig
 
 def create_record_geometry(samples: np.ndarray, cfg: AppConfig) -> mesh.Mesh:
     """
     Generates the 3D mesh for a vinyl-style record from audio samples by
-    building a single, unified list of vertices and faces.
+    building a single, unified set of vertices and faces.
     """
     # --- Configuration Parameters ---
     record_config = cfg.config['record']
@@ -30,44 +31,41 @@ def create_record_geometry(samples: np.ndarray, cfg: AppConfig) -> mesh.Mesh:
     track_width = outer_radius - inner_radius
 
     # --- 1. Generate Base Disc Vertices & Faces ---
-    all_vertices = []
-    all_faces = []
-    
     num_sides_disc = 200
     angles = np.linspace(0, 2 * np.pi, num_sides_disc, endpoint=False)
+    cos_a, sin_a = np.cos(angles), np.sin(angles)
+    z_top = np.full(num_sides_disc, thickness / 2)
 
-    # Add outer-ring vertices (top and bottom)
-    for angle in angles:
-        x, y = record_radius * np.cos(angle), record_radius * np.sin(angle)
-        all_vertices.append([x, y, thickness / 2])
-        all_vertices.append([x, y, -thickness / 2])
+    def ring_vertices(radius):
+        """Interleaved top/bottom vertices around a circle of the given radius."""
+        ring_x, ring_y = radius * cos_a, radius * sin_a
+        top = np.stack([ring_x, ring_y, z_top], axis=1)
+        bottom = np.stack([ring_x, ring_y, -z_top], axis=1)
+        return np.stack([top, bottom], axis=1).reshape(-1, 3)
 
-    # Add inner-hole vertices (top and bottom)
-    for angle in angles:
-        x, y = hole_radius * np.cos(angle), hole_radius * np.sin(angle)
-        all_vertices.append([x, y, thickness / 2])
-        all_vertices.append([x, y, -thickness / 2])
+    # Outer-ring vertices followed by inner-hole vertices (top and bottom)
+    disc_vertices = np.concatenate(
+        [ring_vertices(record_radius), ring_vertices(hole_radius)]
+    ).astype(np.float32)
 
-    # Create faces for disc walls and surfaces
-    for i in range(num_sides_disc):
-        next_i = (i + 1) % num_sides_disc
-        
+    # Create faces for disc walls and surfaces, 8 per angular segment
+    i = np.arange(num_sides_disc, dtype=np.int32)
+    next_i = (i + 1) % num_sides_disc
+    off = num_sides_disc * 2
+    disc_faces = np.stack([
         # Outer wall faces
-        all_faces.append([i * 2, next_i * 2, i * 2 + 1])
-        all_faces.append([next_i * 2, next_i * 2 + 1, i * 2 + 1])
-        
+        np.stack([i * 2, next_i * 2, i * 2 + 1], axis=1),
+        np.stack([next_i * 2, next_i * 2 + 1, i * 2 + 1], axis=1),
         # Inner wall faces
-        off = num_sides_disc * 2
-        all_faces.append([off + i * 2, off + i * 2 + 1, off + next_i * 2])
-        all_faces.append([off + next_i * 2, off + i * 2 + 1, off + next_i * 2 + 1])
-        
+        np.stack([off + i * 2, off + i * 2 + 1, off + next_i * 2], axis=1),
+        np.stack([off + next_i * 2, off + i * 2 + 1, off + next_i * 2 + 1], axis=1),
         # Top surface faces
-        all_faces.append([i * 2, off + i * 2, off + next_i * 2])
-        all_faces.append([i * 2, off + next_i * 2, next_i * 2])
-        
+        np.stack([i * 2, off + i * 2, off + next_i * 2], axis=1),
+        np.stack([i * 2, off + next_i * 2, next_i * 2], axis=1),
         # Bottom surface faces
-        all_faces.append([i * 2 + 1, off + next_i * 2 + 1, off + i * 2 + 1])
-        all_faces.append([i * 2 + 1, next_i * 2 + 1, off + next_i * 2 + 1])
+        np.stack([i * 2 + 1, off + next_i * 2 + 1, off + i * 2 + 1], axis=1),
+        np.stack([i * 2 + 1, next_i * 2 + 1, off + next_i * 2 + 1], axis=1),
+    ], axis=1).reshape(-1, 3)
 
     # --- 2. Generate Spiral Groove ---
     num_rotations = int(track_width / groove_width)
@@ -82,34 +80,43 @@ def create_record_geometry(samples: np.ndarray, cfg: AppConfig) -> mesh.Mesh:
     z_modulation = samples * groove_depth * amplitude_scale
     z_center = (thickness / 2) - (groove_depth / 2) - z_modulation
 
-    # --- 3. Create Groove Mesh by adding to the main vertex/face lists ---
-    for i in range(1, num_points_spiral):
-        direction = np.array([x[i] - x[i-1], y[i] - y[i-1], 0])
-        norm = np.linalg.norm(direction)
-        if norm == 0: continue
-        
-        perp = np.array([-direction[1], direction[0], 0]) / norm
-        
-        v1 = np.array([x[i-1], y[i-1], z_center[i-1]]) - perp * (groove_width / 2)
-        v2 = np.array([x[i-1], y[i-1], z_center[i-1]]) + perp * (groove_width / 2)
-        v3 = np.array([x[i], y[i], z_center[i]]) - perp * (groove_width / 2)
-        v4 = np.array([x[i], y[i], z_center[i]]) + perp * (groove_width / 2)
-
-        # Get the current length of the vertex list to use as the base index
-        idx = len(all_vertices)
-        
-        all_vertices.extend([v1, v2, v3, v4])
-        
-        # Add faces using the correct, globally incrementing base index
-        all_faces.append([idx, idx + 2, idx + 1])
-        all_faces.append([idx + 1, idx + 2, idx + 3])
-
-    # --- 4. Create the final mesh from the combined lists ---
-    vertices_np = np.array(all_vertices)
-    faces_np = np.array(all_faces)
+    # --- 3. Create Groove Mesh as one vectorized block of quads ---
+    # Each consecutive pair of spiral points becomes a quad (two triangles)
+    # offset to either side of the path by half the groove width.
+    dx = np.diff(x)
+    dy = np.diff(y)
+    norm = np.hypot(dx, dy)
+    keep = norm > 0
     
-    combined_mesh = mesh.Mesh(np.zeros(faces_np.shape[0], dtype=mesh.Mesh.dtype))
-    combined_mesh.vectors = vertices_np[faces_np]
+    # Unit perpendicular scaled to half the groove width, in a single multiply
+    scale = (groove_width / 2) / norm[keep]
+    perp = np.zeros((len(scale), 3))
+    np.multiply(-dy[keep], scale, out=perp[:, 0])
+    np.multiply(dx[keep], scale, out=perp[:, 1])
+    
+    centers = np.stack([x, y, z_center], axis=1)
+    prev_pts = centers[:-1][keep]
+    next_pts = centers[1:][keep]
+    
+    # --- 4. Create the final mesh ---
+    # Allocate the mesh's float32 triangle buffer once at its final size and
+    # fill each section straight into its slice of it.
+    n_disc_faces = len(disc_faces)
+    n_groove_faces = 2 * len(prev_pts)
+    combined_mesh = mesh.Mesh(np.zeros(n_disc_faces + n_groove_faces, dtype=mesh.Mesh.dtype))
+    vectors = combined_mesh.vectors
+    vectors[:n_disc_faces] = disc_vertices[disc_faces]
+
+    # Each groove quad (v1, v2) -> (v3, v4) is split into the triangles
+    # (v1, v3, v2) and (v2, v3, v4); write their corners directly.
+    tri_a = vectors[n_disc_faces::2]
+    tri_b = vectors[n_disc_faces + 1::2]
+    np.subtract(prev_pts, perp, out=tri_a[:, 0])
+    np.subtract(next_pts, perp, out=tri_a[:, 1])
+    np.add(prev_pts, perp, out=tri_a[:, 2])
+    tri_b[:, 0] = tri_a[:, 2]
+    tri_b[:, 1] = tri_a[:, 1]
+    np.add(next_pts, perp, out=tri_b[:, 2])
     
     return combined_mesh
 
@@ -117,3 +124,8 @@ def save_mesh_as_stl(mesh_data: mesh.Mesh, file_path: str):
     """Saves a numpy-stl mesh object to an STL file."""
     mesh_data.save(file_path)
 
+def mesh_to_stl_bytes(mesh_data: mesh.Mesh, name: str = "record.stl") -> bytes:
+    """Serializes a numpy-stl mesh object to binary STL bytes in memory."""
+    buf = io.BytesIO()
+    mesh_data.save(name, fh=buf, mode=Mode.BINARY)
+    return buf.getvalue()
@@ -4,8 +4,14 @@
 # __filename__ = "test_suite.py"
 # __description__ = "Test suite for the application using pytest."
 
+import io
 import os
+import wave
 import numpy as np
+import matplotlib.pyplot as plt
+from scipy.io.wavfile import read as read_wav
+from scipy.spatial import cKDTree
+from stl import mesh, Mode
 from pydub import AudioSegment
 import pytest
 
@@ -39,6 +45,21 @@ def test_config_loading():
     assert isinstance(cfg, dict)
     assert "audio_processing" in cfg
 
+def test_config_loading_returns_independent_copies(tmp_path):
+    """Tests that mutating a loaded config does not leak into later loads."""
+    path = tmp_path / "config.toml"
+    path.write_text('[audio]\ntarget_samplerate = 8000\n')
+
+    cfg = config.load_config(str(path))
+    cfg["audio"]["target_samplerate"] = 1
+    cfg["extra"] = True
+
+    assert config.load_config(str(path)) == {"audio": {"target_samplerate": 8000}}
+
+def test_config_loading_missing_file(tmp_path):
+    """Tests that a missing configuration file yields an empty dictionary."""
+    assert config.load_config(str(tmp_path / "missing.toml")) == {}
+
 def test_audio_processing(silent_mp3_file, app_config):
     """Tests that audio processing returns a valid numpy array and sample rate."""
     samples, sample_rate = audio_processing.process_audio(silent_mp3_file, app_config)
@@ -47,6 +68,169 @@ def test_audio_processing(silent_mp3_file, app_config):
     assert sample_rate == app_config['audio_processing']['sample_rate']
     assert len(samples) > 0
 
+def _lowest_z_reference(vertices, query_xy, radius, empty_value):
+    """Brute-force reference for validation._lowest_z_in_cylinders."""
+    tree = cKDTree(vertices[:, :2].astype(np.float64))
+    expected = np.full(len(query_xy), empty_value, dtype=np.float32)
+    for i, idx in enumerate(tree.query_ball_point(query_xy, radius)):
+        if idx:
+            expected[i] = vertices[idx, 2].min()
+    return expected
+
+@pytest.mark.parametrize("seed", range(10))
+def test_lowest_z_in_cylinders_matches_kdtree(seed):
+    """Tests the grid search against a KD-tree, including queries off the mesh and small blocks."""
+    rng = np.random.default_rng(seed)
+    vertices = rng.uniform(-5, 5, size=(rng.integers(1, 2000), 3)).astype(np.float32)
+    # Half of the queries lie beyond the vertex extent
+    query_xy = rng.uniform(-10, 10, size=(rng.integers(1, 500), 2))
+    radius = rng.uniform(0.05, 1.0)
+
+    expected = _lowest_z_reference(vertices, query_xy, radius, -1.0)
+    for block_size in (7, len(query_xy), 65536):
+        result = validation._lowest_z_in_cylinders(vertices, query_xy, radius, -1.0, block_size=block_size)
+        np.testing.assert_array_equal(result, expected)
+
+def test_lowest_z_in_cylinders_empty_inputs():
+    """Tests that empty vertex or query arrays are handled."""
+    vertices = np.zeros((0, 3), dtype=np.float32)
+    query_xy = np.zeros((3, 2))
+    np.testing.assert_array_equal(validation._lowest_z_in_cylinders(vertices, query_xy, 0.5, -1.0), [-1.0] * 3)
+
+    vertices = np.ones((4, 3), dtype=np.float32)
+    assert len(validation._lowest_z_in_cylinders(vertices, np.zeros((0, 2)), 0.5, -1.0)) == 0
+
+@pytest.mark.parametrize("in_len, out_len", [
+    (1000, 3000),        # upsampling by an exact ratio
+    (3000, 1000),        # downsampling by an exact ratio
+    (54321, 12345),      # ratio approximated, then interpolated
+    (5184, 7777),
+    (99989, 100013),     # near-1 ratios that approximate to 1
+    (1035748, 1036000),
+    (10, 500),           # too short for the FIR, interpolated
+    (64, 100000),        # ratio too large for the FIR, interpolated
+    (100000, 3),         # ratio approximates to zero, interpolated
+])
+def test_resample_to_length(in_len, out_len):
+    """Tests that resampling returns exactly the requested length without warping the signal."""
+    cycles = max(min(in_len, out_len) / 50, 0.05)
+    samples = np.sin(2 * np.pi * cycles * np.arange(in_len) / in_len).astype(np.float32)
+    resampled = validation._resample_to_length(samples, out_len)
+    assert len(resampled) == out_len
+
+    # Compare with the sine at the output sample times, away from the FIR's
+    # edge transients and past the last input sample
+    expected = np.sin(2 * np.pi * cycles * np.arange(out_len) / out_len)
+    inner = slice(out_len // 20, out_len - max(out_len // 20, out_len // in_len + 1))
+    np.testing.assert_allclose(resampled[inner], expected[inner], atol=5e-3)
+
+def test_decimate_for_preview_budget_and_winding():
+    """Tests that decimation fills most of the face budget and keeps triangles facing up."""
+    n = 200
+    x, y = np.meshgrid(np.linspace(0, 50, n), np.linspace(0, 50, n), indexing='ij')
+    grid = np.stack([x, y, np.zeros_like(x)], axis=-1)
+    a, b, c, d = grid[:-1, :-1], grid[1:, :-1], grid[:-1, 1:], grid[1:, 1:]
+    vectors = np.concatenate([np.stack([a, b, d], axis=-2), np.stack([a, d, c], axis=-2)]).reshape(-1, 3, 3)
+
+    points, faces = validation._decimate_for_preview(vectors, max_faces=5000)
+    assert 0.5 * 5000 <= len(faces) <= 5000
+    corners = points[faces]
+    normals = np.cross(corners[:, 1] - corners[:, 0], corners[:, 2] - corners[:, 0])
+    assert np.all(normals[:, 2] > 0)
+
+@pytest.fixture
+def small_mesh():
+    """Provides a small mesh of random triangles."""
+    data = np.zeros(50, dtype=mesh.Mesh.dtype)
+    data['vectors'] = np.random.default_rng(0).uniform(-10, 10, size=(50, 3, 3))
+    return mesh.Mesh(data)
+
+def test_load_mesh_binary(small_mesh, tmp_path):
+    """Tests that binary STLs are memory-mapped and match numpy-stl's reader."""
+    path = tmp_path / "record.stl"
+    path.write_bytes(geometry_generator.mesh_to_stl_bytes(small_mesh))
+
+    loaded = validation._load_mesh(str(path))
+    assert isinstance(loaded.data, np.memmap)
+    np.testing.assert_array_equal(loaded.vectors, mesh.Mesh.from_file(str(path)).vectors)
+    assert validation._load_mesh(loaded) is loaded
+
+def test_load_mesh_ascii(small_mesh, tmp_path):
+    """Tests that ASCII STLs fall back to numpy-stl's reader."""
+    path = tmp_path / "record.stl"
+    small_mesh.save(str(path), mode=Mode.ASCII)
+
+    loaded = validation._load_mesh(str(path))
+    assert not isinstance(loaded.data, np.memmap)
+    np.testing.assert_array_equal(loaded.vectors, mesh.Mesh.from_file(str(path)).vectors)
+    np.testing.assert_allclose(loaded.vectors, small_mesh.vectors, atol=1e-4)
+
+def _wav_bytes(channels, frame_rate=44100, seconds=1.0):
+    """Builds 16-bit PCM WAV bytes of a 440 Hz tone (quieter on the right channel)."""
+    t = np.arange(int(frame_rate * seconds)) / frame_rate
+    tone = 0.5 * np.sin(2 * np.pi * 440 * t)
+    pcm = np.stack([tone * (0.5 if c else 1.0) for c in range(channels)], axis=1)
+    buf = io.BytesIO()
+    with wave.open(buf, 'wb') as w:
+        w.setnchannels(channels)
+        w.setsampwidth(2)
+        w.setframerate(frame_rate)
+        w.writeframes((pcm * 32767).astype('<i2').tobytes())
+    return buf.getvalue()
+
+@pytest.mark.parametrize("channels", [1, 2])
+def test_decode_audio_av_and_pydub_agree(channels, monkeypatch):
+    """Tests both decoders return normalized float32 mono at the target rate, and agree."""
+    pytest.importorskip("av")
+    file_bytes = _wav_bytes(channels)
+
+    decoded = {}
+    for name in ("av", "pydub"):
+        if name == "pydub":
+            monkeypatch.setattr(audio_processing, "av", None)
+        samples = audio_processing.decode_audio(file_bytes, "wav", 8000)
+        assert samples.dtype == np.float32
+        assert len(samples) == 8000
+        assert np.abs(samples).max() == pytest.approx(1.0)
+        decoded[name] = samples
+
+    np.testing.assert_allclose(decoded["av"], decoded["pydub"], atol=1e-3)
+
+def test_load_and_process_audio_probes_format():
+    """Tests that a BytesIO without a file name is decoded by probing its container."""
+    pytest.importorskip("av")
+
+    class Cfg:
+        audio = {'target_samplerate': 8000}
+
+    samples = audio_processing.load_and_process_audio(io.BytesIO(_wav_bytes(1)), Cfg())
+    assert len(samples) == 8000
+
+def test_convert_samples_to_wav_bytes_saturates():
+    """Tests that out-of-range samples clip to full scale instead of wrapping."""
+    samples = np.array([-2.0, -1.0, 0.0, 0.5, 1.0, 2.0], dtype=np.float32)
+    rate, pcm = read_wav(io.BytesIO(validation.convert_samples_to_wav_bytes(samples, 8000)))
+    assert rate == 8000
+    assert pcm.dtype == np.int16
+    np.testing.assert_array_equal(pcm, [-32767, -32767, 0, 16384, 32767, 32767])
+
+@pytest.mark.parametrize("seed", range(5))
+def test_compare_audio_signals_matches_corrcoef(seed):
+    """Tests the similarity score against np.corrcoef on random signals."""
+    rng = np.random.default_rng(seed)
+    original = rng.standard_normal(10000).astype(np.float32)
+    extracted = (original + rng.uniform(0.1, 3.0) * rng.standard_normal(10000)).astype(np.float32)
+
+    score, fig = validation.compare_audio_signals(original, extracted)
+    plt.close(fig)
+    assert score == pytest.approx(np.corrcoef(original, extracted)[0, 1], abs=1e-9)
+
+def test_compare_audio_signals_constant_input():
+    """Tests that a constant signal has no defined correlation."""
+    score, fig = validation.compare_audio_signals(np.ones(1000, dtype=np.float32), np.linspace(-1, 1, 1000))
+    plt.close(fig)
+    assert np.isnan(score)
+
 # --- Integration Test ---
 def test_full_generation_and_validation(silent_mp3_file, app_config):
     """
@@ -6,25 +6,102 @@ __filename__ = "validation.py"
 
 import numpy as np
 from stl import mesh
-from scipy.spatial import KDTree
 from scipy.io.wavfile import write as write_wav
-from scipy.signal import resample
+from scipy.signal import resample_poly
+from fractions import Fraction
 import io
+import os
 import matplotlib.pyplot as plt
 import plotly.graph_objects as go
 
+def _load_mesh(stl_path):
+    """
+    Reads an STL file, passing through a numpy-stl Mesh that is already
+    loaded. Binary STLs are memory-mapped: their 50-byte triangle records
+    match mesh.Mesh.dtype, so the triangles are used in place instead of
+    being parsed and copied. Anything else goes through numpy-stl's reader.
+    """
+    if isinstance(stl_path, mesh.Mesh):
+        return stl_path
+
+    # A binary STL is an 80-byte header, a uint32 triangle count and then
+    # exactly that many fixed-size records
+    size = os.path.getsize(stl_path)
+    if size > 84:
+        num_triangles = int(np.fromfile(stl_path, dtype='<u4', count=1, offset=80)[0])
+        if size == 84 + num_triangles * mesh.Mesh.dtype.itemsize:
+            data = np.memmap(stl_path, dtype=mesh.Mesh.dtype, mode='c', offset=84, shape=(num_triangles,))
+            return mesh.Mesh(data, calculate_normals=False)
+
+    return mesh.Mesh.from_file(stl_path)
+
+def _lowest_z_in_cylinders(vertices, query_xy, radius, empty_value, progress_bar=None, block_size=65536):
+    """
+    For each query point, finds the lowest Z among the vertices whose XY
+    position lies within `radius` of it, or `empty_value` if there are none.
+
+    Vertices are bucketed into a uniform grid of radius-sized cells, sorted so
+    each cell is a contiguous run, so a query only has to scan the 3x3 block
+    of cells around it.
+    """
+    z_min = np.full(len(query_xy), empty_value, dtype=np.float32)
+    if len(vertices) == 0 or len(query_xy) == 0:
+        return z_min
+
+    # Pack each vertex's grid cell into one sortable key. Cells are shifted to
+    # start at 1 and each column gets a spare row, so the +/-1 neighbour
+    # offsets of an in-range cell never wrap into a populated column.
+    origin = np.floor(vertices[:, :2].min(axis=0) / radius) - 1
+    cells = (np.floor(vertices[:, :2] / radius) - origin).astype(np.int64)
+    stride = cells[:, 1].max() + 2
+    keys = cells[:, 0] * stride + cells[:, 1]
+
+    order = np.argsort(keys, kind='stable')
+    keys = keys[order]
+    xy = vertices[order, :2].astype(np.float64)
+    z = vertices[order, 2]
+
+    neighbour_offsets = (np.arange(-1, 2)[:, None] * stride + np.arange(-1, 2)).ravel()
+    radius_sq = radius * radius
+
+    for start in range(0, len(query_xy), block_size):
+        q = query_xy[start:start + block_size]
+        q_cells = (np.floor(q / radius) - origin).astype(np.int64)
+        q_keys = ((q_cells[:, 0] * stride + q_cells[:, 1])[:, None] + neighbour_offsets).ravel()
+
+        # Candidate vertices of every query, grouped query by query
+        lo = np.searchsorted(keys, q_keys, side='left')
+        counts = np.searchsorted(keys, q_keys, side='right') - lo
+        total = counts.sum()
+        if total:
+            cand = np.arange(total) - np.repeat(np.cumsum(counts) - counts - lo, counts)
+            per_query = counts.reshape(-1, 9).sum(axis=1)
+            q_idx = np.repeat(np.arange(len(q)), per_query)
+
+            d_sq = (xy[cand, 0] - q[q_idx, 0]) ** 2 + (xy[cand, 1] - q[q_idx, 1]) ** 2
+            cand_z = np.where(d_sq <= radius_sq, z[cand], np.inf)
+
+            has_cand = per_query > 0
+            q_starts = np.cumsum(per_query) - per_query
+            block_min = np.minimum.reduceat(cand_z, q_starts[has_cand])
+            found = np.isfinite(block_min)
+            z_min[start:start + len(q)][np.flatnonzero(has_cand)[found]] = block_min[found]
+
+        if progress_bar:
+            progress_bar.progress(min(start + block_size, len(query_xy)) / len(query_xy))
+
+    return z_min
+
 def extract_audio_from_stl(stl_path, config, rpm, progress_bar=None, status_text=None):
     """
     Extracts an audio waveform by finding the lowest point in a search
-    cylinder along the spiral path, simulating a stylus.
+    cylinder along the spiral path, simulating a stylus. `stl_path` may also
+    be an already-loaded numpy-stl Mesh.
     """
     if status_text: status_text.info("⚙️ Loading STL file...")
-    record_mesh = mesh.Mesh.from_file(stl_path)
+    record_mesh = _load_mesh(stl_path)
     vertices = record_mesh.vectors.reshape(-1, 3)
 
-    if status_text: status_text.info("🌳 Building spatial search tree...")
-    tree = KDTree(vertices)
-
     dims = config['record_dimensions']
     geom = config['groove_geometry']
     
@@ -38,49 +115,86 @@ def extract_audio_from_stl(stl_path, config, rpm, progress_bar=None, status_text
     
     proxy_sr = 22050 
     num_points = int(total_duration_seconds * proxy_sr)
-    theta = np.linspace(0, total_rotations * 2 * np.pi, num=num_points)
-    r = np.linspace(r_start, r_end, num=num_points)
 
+    # The spiral is linear in both angle and radius over num_points samples,
+    # so it is only evaluated at the decimated indices that are checked
     decimation_factor = 20
-    indices_to_check = np.arange(0, len(theta), decimation_factor)
+    indices_to_check = np.arange(0, num_points, decimation_factor)
     num_steps = len(indices_to_check)
+    t = indices_to_check / (num_points - 1) if num_points > 1 else np.zeros(num_steps)
+    theta_check = t * (total_rotations * 2 * np.pi)
+    r_check = r_start + t * (r_end - r_start)
     
     if status_text: status_text.info(f"🔬 Analyzing {num_steps} points on the groove...")
 
-    extracted_depths = []
     base_depth = -geom['groove_depth_mm']
     search_radius = geom['groove_pitch_mm'] / 2.0
 
-    for i, idx in enumerate(indices_to_check):
-        angle, radius_val = theta[idx], r[idx]
-        x, y = radius_val * np.cos(angle), radius_val * np.sin(angle)
-        
-        # Find all vertices within a cylinder around the ideal spiral point
-        indices_in_radius = tree.query_ball_point([x, y, 0], r=search_radius)
-        
-        if not indices_in_radius:
-            # If no points are found, assume it's a silent part at base depth
-            z_val = base_depth
-        else:
-            # Of the points found, take the one with the lowest Z value
-            points_in_cylinder = vertices[indices_in_radius]
-            lowest_point = points_in_cylinder[np.argmin(points_in_cylinder[:, 2])]
-            z_val = lowest_point[2]
-
-        amplitude = (z_val - base_depth) / (geom['amplitude_scale'] * geom['groove_depth_mm'])
-        extracted_depths.append(amplitude)
+    # Only vertices within search_radius of the spiral's annulus can fall in a
+    # cylinder; the rim, centre hole and flat surfaces beyond it are dropped
+    # before indexing (with a little slack for float32 rounding).
+    slack = search_radius * 1.01
+    vertex_r = np.hypot(vertices[:, 0], vertices[:, 1])
+    vertices = vertices[(vertex_r >= r_end - slack) & (vertex_r <= r_start + slack)]
 
-        if progress_bar:
-            progress_bar.progress(i / num_steps)
-            
-    extracted_samples = np.array(extracted_depths, dtype=np.float32)
+    # Find the lowest vertex within a cylinder around each ideal spiral point.
+    # Cylinders with no points are assumed silent, i.e. at base depth.
+    query_points = np.stack([r_check * np.cos(theta_check), r_check * np.sin(theta_check)], axis=1)
+    z_min = _lowest_z_in_cylinders(vertices, query_points, search_radius, base_depth, progress_bar)
 
-    max_abs = np.max(np.abs(extracted_samples))
+    # Convert depths to amplitudes in place on the float32 buffer
+    extracted_samples = z_min
+    extracted_samples -= base_depth
+    extracted_samples *= 1.0 / (geom['amplitude_scale'] * geom['groove_depth_mm'])
+
+    max_abs = max(-extracted_samples.min(), extracted_samples.max()) if extracted_samples.size else 0.0
     if max_abs > 0:
-        extracted_samples /= max_abs
+        extracted_samples *= 1.0 / max_abs
 
     return extracted_samples
 
+def _resample_to_length(samples, num_samples):
+    """
+    Resamples a signal to exactly `num_samples` points with a polyphase FIR.
+    A length ratio that reduces to a small fraction is used as-is. Otherwise
+    the FIR runs at a nearby small-denominator ratio and its output is
+    linearly interpolated at the exact output sample times, so the signal is
+    neither stretched nor shifted. Very short inputs, and ratios too extreme
+    for the FIR, are linearly interpolated throughout.
+    """
+    exact = Fraction(num_samples, len(samples))
+    ratio = exact.limit_denominator(1000)
+    if len(samples) < 64 or ratio.numerator == 0 or ratio.numerator > 1000:
+        resampled, ratio = samples, Fraction(1)
+    elif ratio != 1:
+        resampled = resample_poly(samples, ratio.numerator, ratio.denominator)
+        if ratio == exact:
+            # The output of an exact ratio is already num_samples long
+            return resampled
+    else:
+        resampled = samples
+
+    # Output sample j falls at j / exact input samples, i.e. at j * ratio /
+    # exact samples of the resampled signal
+    positions = np.arange(num_samples) * float(ratio / exact)
+    return np.interp(positions, np.arange(len(resampled)), resampled)
+
+def _plot_envelope(samples, max_points=8000):
+    """
+    Reduces a long signal to alternating per-bin min/max values for plotting,
+    which looks the same as plotting every sample at screen resolution.
+    Returns the sample numbers and values to pass to ax.plot.
+    """
+    if len(samples) <= max_points:
+        return np.arange(len(samples)), samples
+
+    num_bins = max_points // 2
+    starts = np.linspace(0, len(samples), num_bins, endpoint=False).astype(np.intp)
+    values = np.empty(2 * num_bins, dtype=samples.dtype)
+    values[0::2] = np.minimum.reduceat(samples, starts)
+    values[1::2] = np.maximum.reduceat(samples, starts)
+    return np.repeat(starts, 2), values
+
 def compare_audio_signals(original_samples, extracted_samples):
     """
     Compares two audio signals and generates a plot by resampling
@@ -89,26 +203,34 @@ def compare_audio_signals(original_samples, extracted_samples):
     if len(extracted_samples) == 0 or len(original_samples) == 0:
         return 0.0, plt.figure()
 
-    if len(original_samples) > len(extracted_samples):
+    if len(original_samples) == len(extracted_samples):
+        original_final = original_samples
+        extracted_final = extracted_samples
+    elif len(original_samples) > len(extracted_samples):
         num_samples = len(original_samples)
-        extracted_final = resample(extracted_samples, num_samples)
+        extracted_final = _resample_to_length(extracted_samples, num_samples)
         original_final = original_samples
     else:
         num_samples = len(extracted_samples)
-        original_final = resample(original_samples, num_samples)
+        original_final = _resample_to_length(original_samples, num_samples)
         extracted_final = extracted_samples
     
-    correlation = np.corrcoef(original_final, extracted_final)[0, 1]
+    # Pearson correlation from the centred signals (accumulated in float64);
+    # as with np.corrcoef, a constant signal gives nan
+    a = np.subtract(original_final, original_final.mean(), dtype=np.float64)
+    b = np.subtract(extracted_final, extracted_final.mean(), dtype=np.float64)
+    denom = np.sqrt(np.dot(a, a) * np.dot(b, b))
+    correlation = np.dot(a, b) / denom if denom > 0 else np.nan
     
     fig, (ax1, ax2) = plt.subplots(2, 1, figsize=(10, 6), sharex=True, sharey=True)
     
-    ax1.plot(original_final, label="Original Processed Audio", color='dodgerblue')
+    ax1.plot(*_plot_envelope(original_final), label="Original Processed Audio", color='dodgerblue')
     ax1.set_title("Original Processed Audio")
     ax1.set_ylabel("Amplitude")
     ax1.legend(loc="upper right")
     ax1.grid(True, alpha=0.3)
     
-    ax2.plot(extracted_final, label="Audio Extracted from STL", color='darkorange', linestyle='--')
+    ax2.plot(*_plot_envelope(extracted_final), label="Audio Extracted from STL", color='darkorange', linestyle='--')
     ax2.set_title("Audio Extracted from STL")
     ax2.set_xlabel("Sample Number")
     ax2.set_ylabel("Amplitude")
@@ -124,19 +246,112 @@ def convert_samples_to_wav_bytes(samples, sample_rate):
     if len(samples) == 0:
         samples = np.array([0], dtype=np.float32)
         
-    samples_int16 = (samples * 32767).astype(np.int16)
+    # Clip, scale and round in a single float buffer so out-of-range samples
+    # saturate instead of wrapping around when cast to int16
+    scaled = np.clip(samples, -1.0, 1.0)
+    np.multiply(scaled, 32767, out=scaled)
+    np.rint(scaled, out=scaled)
+    samples_int16 = scaled.astype(np.int16)
     byte_io = io.BytesIO()
     write_wav(byte_io, int(sample_rate), samples_int16)
     return byte_io.getvalue()
 
+def _decimate_for_preview(vectors, max_faces=50_000):
+    """
+    Simplifies a triangle soup for the interactive preview by vertex
+    clustering: vertices are snapped to a grid, each occupied cell becomes a
+    single vertex at the mean of its members, and triangles that collapse or
+    repeat are dropped. The XY cell size is searched for so the result lands
+    just under `max_faces`; Z keeps a fine grid so the surfaces and groove
+    stay distinct.
+
+    Returns the vertex array and an (M, 3) array of face indices.
+    """
+    points = vectors.reshape(-1, 3).astype(np.float64)
+    faces = np.arange(len(points)).reshape(-1, 3)
+    if len(faces) <= max_faces:
+        return points, faces
+
+    lo = points.min(axis=0)
+    extent = np.maximum(points.max(axis=0) - lo, 1e-9)
+    z_cell = extent[2] / 16
+
+    def cluster(pts, xy_cell):
+        # Pack each point's grid cell into one key and label the clusters
+        cells = np.floor((pts - lo) / (xy_cell, xy_cell, z_cell)).astype(np.int64)
+        dims = cells.max(axis=0) + 1
+        keys = (cells[:, 0] * dims[1] + cells[:, 1]) * dims[2] + cells[:, 2]
+        return np.unique(keys, return_inverse=True)[1]
+
+    def collapse(labels, tri):
+        # Keep triangles that still span three distinct clusters, once each.
+        # Repeats are found by their sorted corners, but the first copy is
+        # returned as-is so its winding (and so its normal) is preserved.
+        tri = labels[tri]
+        tri = tri[(tri[:, 0] != tri[:, 1]) & (tri[:, 1] != tri[:, 2]) & (tri[:, 0] != tri[:, 2])]
+        corners = np.sort(tri, axis=1)
+        order = np.lexsort((corners[:, 2], corners[:, 0] * (labels.max() + 1) + corners[:, 1]))
+        corners = corners[order]
+        first = order[np.r_[True, np.any(corners[1:] != corners[:-1], axis=1)]]
+        return tri[np.sort(first)]
+
+    # Merge the soup's coincident corners once on a grid far finer than the
+    # triangles; the search below then only re-clusters these base points.
+    base_cell = np.sqrt(extent[0] * extent[1] / len(faces)) / 64
+    base = cluster(points, base_cell)
+    weights = np.bincount(base).astype(np.float64)
+    base_points = np.stack(
+        [np.bincount(base, weights=points[:, axis]) for axis in range(3)], axis=1
+    ) / weights[:, None]
+    base_faces = collapse(base, faces)
+    labels, tri = np.arange(len(base_points)), base_faces
+
+    if len(tri) > max_faces:
+        # Bracket the XY cell size between a grid that keeps too many faces
+        # and one that fits, starting from a uniform-grid estimate ...
+        fine, fine_faces = base_cell, len(tri)
+        coarse = np.sqrt(2 * extent[0] * extent[1] / max_faces)
+        while True:
+            labels = cluster(base_points, coarse)
+            tri = collapse(labels, base_faces)
+            if len(tri) <= max_faces:
+                break
+            fine, fine_faces, coarse = coarse, len(tri), coarse * 2
+
+        # ... then narrow it by interpolating the face count on log-log axes
+        # until the preview uses most of the budget
+        target = 0.95 * max_faces
+        for _ in range(8):
+            if len(tri) >= 0.9 * max_faces:
+                break
+            t = np.clip(np.log(fine_faces / target) / np.log(fine_faces / len(tri)), 0.1, 0.9)
+            cell = fine * (coarse / fine) ** t
+            cell_labels = cluster(base_points, cell)
+            cell_tri = collapse(cell_labels, base_faces)
+            if len(cell_tri) <= max_faces:
+                coarse, labels, tri = cell, cell_labels, cell_tri
+            else:
+                fine, fine_faces = cell, len(cell_tri)
+
+    counts = np.bincount(labels, weights=weights)
+    centroids = np.stack(
+        [np.bincount(labels, weights=weights * base_points[:, axis]) for axis in range(3)], axis=1
+    ) / counts[:, None]
+    return centroids, tri
+
 def create_3d_figure(stl_path):
-    """Creates an interactive 3D plot of the STL mesh using Plotly."""
-    m = mesh.Mesh.from_file(stl_path)
-    
-    vectors = m.vectors
-    x, y, z = vectors.reshape(-1, 3).T
+    """
+    Creates an interactive 3D plot of the STL mesh using Plotly. The mesh is
+    decimated first so the figure stays small enough to render in a browser.
+    `stl_path` may also be an already-loaded numpy-stl Mesh.
+    """
+    m = _load_mesh(stl_path)
     
-    i, j, k = np.arange(len(x)).reshape(-1, 3).T
+    points, faces = _decimate_for_preview(m.vectors)
+    # Transpose into contiguous rows (int32 indices) so Plotly serialises
+    # each coordinate and index array without another strided copy
+    x, y, z = np.ascontiguousarray(points.T)
+    i, j, k = np.ascontiguousarray(faces.T, dtype=np.int32)
 
     fig = go.Figure(data=[
         go.Mesh3d(
@@ -155,22 +370,24 @@ def create_3d_figure(stl_path):
 def validate_stl(stl_path, original_samples, sample_rate, config, rpm, progress_bar, status_text):
     """Runs the full validation pipeline and returns a dictionary of results."""
     
-    extracted_samples = extract_audio_from_stl(stl_path, config, rpm, progress_bar, status_text)
+    # Parse the STL once and share it between extraction and the 3D view
+    record_mesh = _load_mesh(stl_path)
+    extracted_samples = extract_audio_from_stl(record_mesh, config, rpm, progress_bar, status_text)
+
+    # Bring the extracted audio to the original's length once; both the
+    # comparison and the playback WAV use the resampled signal.
+    if len(extracted_samples) > 0 and len(original_samples) > 0:
+        extracted_samples = _resample_to_length(extracted_samples, len(original_samples))
     
     if status_text: status_text.info("📊 Comparing waveforms...")
     score, fig_wave = compare_audio_signals(original_samples, extracted_samples)
     
     if status_text: status_text.info("🔊 Preparing audio playback...")
     original_wav = convert_samples_to_wav_bytes(original_samples, sample_rate)
-    
-    if len(extracted_samples) > 0:
-        resampled_extracted = resample(extracted_samples, len(original_samples))
-        extracted_wav = convert_samples_to_wav_bytes(resampled_extracted, sample_rate)
-    else:
-        extracted_wav = convert_samples_to_wav_bytes(extracted_samples, sample_rate)
+    extracted_wav = convert_samples_to_wav_bytes(extracted_samples, sample_rate)
 
     if status_text: status_text.info("🧊 Generating 3D model view...")
-    fig_3d = create_3d_figure(stl_path)
+    fig_3d = create_3d_figure(record_mesh)
 
     return {
         "similarity_score": score,